@@ -1,47 +1,146 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Boolean
-from sqlalchemy.orm import sessionmaker, declarative_base, Session, relationship
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete, event, exists, func, select, update, Column, Index, Integer, String, Float, ForeignKey, Boolean
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, relationship, selectinload, raiseload, column_property
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from pydantic import BaseModel, constr
 from typing import List, Optional
-import requests
+from functools import lru_cache
+import asyncio
+import contextlib
+import logging
+import os
+import time
+import httpx
 
-# Initialize FastAPI app
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Initialize FastAPI app (responses are serialized with orjson)
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Compress larger responses (e.g. mission lists); small single-object payloads stay uncompressed
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Debug mode makes accidental lazy loading on list endpoints raise a clear raiseload error instead of MissingGreenlet
+DEBUG = os.getenv("DEBUG", "").lower() in ("1", "true", "yes")
 
 # TheCatAPI URL for breed validation
 CAT_API_URL = "https://api.thecatapi.com/v1/breeds"
 
+# Shared TheCatAPI client so connections are kept alive between breed lookups
+cat_client = httpx.AsyncClient(timeout=2.0, limits=httpx.Limits(max_keepalive_connections=10))
+
+# Known breeds, preloaded at startup and refreshed in the background
+BREED_REFRESH_INTERVAL = 7 * 24 * 60 * 60
+# After a failed on-demand load, answer 503 straight away for this many seconds instead of retrying
+BREED_RETRY_INTERVAL = 30
+# Network errors plus the ones raised by a non-JSON body or an unexpected payload shape
+BREED_LOAD_ERRORS = (httpx.HTTPError, ValueError, KeyError, TypeError, AttributeError)
+BREEDS = frozenset()
+_breeds_lock = asyncio.Lock()
+_breeds_retry_after = 0.0
+_breeds_refresh_task = None
+
 # Database setup
-DATABASE_URL = "sqlite:///./spy_cat_agency.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=True, bind=engine)
+DATABASE_URL = "sqlite+aiosqlite:///./spy_cat_agency.db"
+# Set DB_INIT_ON_STARTUP=0 when the schema is created at deploy time with `python -m main`
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "1").lower() in ("1", "true", "yes")
+_db_initialized = False
+# Keep long-lived connections so SQLite's page cache stays warm between requests
+# (aiosqlite defaults to NullPool, which reconnects on every session)
+DB_POOL_SIZE = 20
+DB_MAX_OVERFLOW = 0
+
+# SQLite PRAGMAs applied once per pooled connection: WAL lets readers run alongside a writer
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA busy_timeout=5000",
+)
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+# Engine and session factory are created once per process, so every caller shares one connection pool.
+# They are built by a startup hook, before requests can race to create them
+@lru_cache(maxsize=1)
+def get_engine():
+    engine = create_async_engine(
+        DATABASE_URL,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+    )
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    return engine
+
+@lru_cache(maxsize=1)
+def get_sessionmaker():
+    return async_sessionmaker(get_engine(), autoflush=True, expire_on_commit=False)
+
 Base = declarative_base()
 
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with get_sessionmaker()() as db:
         yield db
-    finally:
-        db.close()
 
 # Helper function to get Mission by ID
-def get_mission_by_id(mission_id: int, db: Session):
-    mission = db.query(Mission).filter(Mission.id == mission_id).first()
+async def get_mission_by_id(mission_id: int, db: AsyncSession):
+    result = await db.execute(select(Mission).options(*mission_load_options()).filter(Mission.id == mission_id))
+    mission = result.scalars().first()
     if not mission:
         raise HTTPException(status_code=404, detail="Mission not found")
     return mission
 
+# Helper function to eager-load the relationships serialized by MissionRead in batched SELECTs
+def mission_load_options():
+    return (selectinload(Mission.targets), selectinload(Mission.assigned_cats))
+
+# Helper function to make any relationship that was not eager-loaded raise instead of lazy loading (DEBUG only)
+def strict_load_options():
+    return (raiseload("*"),) if DEBUG else ()
+
+# Helper function to reload the set of known breeds from TheCatAPI
+async def load_breeds():
+    global BREEDS
+    response = await cat_client.get(CAT_API_URL)
+    response.raise_for_status()
+    BREEDS = frozenset(b["name"].lower() for b in response.json())
+
+# Background task keeping the breed set fresh; a failed refresh keeps the previous set
+async def refresh_breeds_periodically():
+    while True:
+        await asyncio.sleep(BREED_REFRESH_INTERVAL)
+        try:
+            await load_breeds()
+        except BREED_LOAD_ERRORS:
+            logger.warning("Failed to refresh breeds from TheCatAPI", exc_info=True)
+
 # Helper function to validate cat breed
-def validate_cat_breed(breed: str):
-    try:
-        response = requests.get(CAT_API_URL)
-        response.raise_for_status()
-        breeds = [b["name"].lower() for b in response.json()]
-        if breed.lower() not in breeds:
-            raise HTTPException(status_code=400, detail=f"Breed '{breed}' is not recognized.")
-    except requests.RequestException as e:
-        raise HTTPException(status_code=503, detail="Unable to validate breed due to external API error.")
+async def validate_cat_breed(breed: str):
+    global _breeds_retry_after
+    if not BREEDS:
+        # Startup preload failed, try again before answering unless the last attempt failed just now
+        async with _breeds_lock:
+            if not BREEDS:
+                if time.monotonic() < _breeds_retry_after:
+                    raise HTTPException(status_code=503, detail="Unable to validate breed due to external API error.")
+                try:
+                    await load_breeds()
+                except BREED_LOAD_ERRORS:
+                    _breeds_retry_after = time.monotonic() + BREED_RETRY_INTERVAL
+                    raise HTTPException(status_code=503, detail="Unable to validate breed due to external API error.")
+    if breed.lower() not in BREEDS:
+        raise HTTPException(status_code=400, detail=f"Breed '{breed}' is not recognized.")
 
 # Spy Cat, Mission and Target Database Models
 class SpyCat(Base):
@@ -52,7 +151,7 @@ class SpyCat(Base):
     experience_years = Column(Integer, nullable=False)
     breed = Column(String, nullable=False)
     salary = Column(Float, nullable=False)
-    current_mission_id = Column(Integer, ForeignKey("missions.id"), nullable=True)
+    current_mission_id = Column(Integer, ForeignKey("missions.id"), nullable=True, index=True)
     current_mission = relationship("Mission", back_populates="assigned_cats")
 
 class Mission(Base):
@@ -63,6 +162,17 @@ class Mission(Base):
     is_completed = Column(Boolean, default=False)
     assigned_cats = relationship("SpyCat", back_populates="current_mission")
     targets = relationship("Target", back_populates="mission", cascade="all, delete-orphan")
+    # Number of assigned cats computed in SQL; deferred, so load it with undefer(Mission.assigned_cats_count)
+    assigned_cats_count = column_property(
+        select(func.count(SpyCat.id))
+        .where(SpyCat.current_mission_id == id)
+        .correlate_except(SpyCat)
+        .scalar_subquery(),
+        deferred=True,
+    )
+
+    # Partial index covering only open missions
+    __table_args__ = (Index("ix_missions_open", is_completed, sqlite_where=is_completed.is_(False)),)
 
 class Target(Base):
     __tablename__ = "targets"
@@ -72,7 +182,7 @@ class Target(Base):
     country = Column(String, nullable=False)
     notes = Column(String, nullable=True)
     is_completed = Column(Boolean, default=False)
-    mission_id = Column(Integer, ForeignKey("missions.id"), nullable=False)
+    mission_id = Column(Integer, ForeignKey("missions.id"), nullable=False, index=True)
     mission = relationship("Mission", back_populates="targets")
 
 # Spy Cat, Mission and Target Pydantic Schema
@@ -122,109 +232,200 @@ class MissionRead(MissionBase):
     class Config:
         from_attributes = True
 
-# Create Database Tables
-Base.metadata.create_all(bind=engine)
+# Keyset-paginated list responses; pass next_after as `after` to fetch the following page
+class SpyCatPage(BaseModel):
+    items: List[SpyCatRead]
+    next_after: Optional[int]
+
+class MissionPage(BaseModel):
+    items: List[MissionRead]
+    next_after: Optional[int]
+
+# Helper function to add indexes missing from databases created before they were declared
+def create_missing_indexes(conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+# Largest page the list endpoints return
+MAX_PAGE_SIZE = 500
+
+# Helper function to serialize a page of ORM rows straight to JSON bytes with the page model's compiled schema.
+# Rows are validated while the request session is open, so database and loading errors surface as a 500
+def page_response(page_model, rows, limit: int):
+    next_after = rows[-1].id if rows and len(rows) == limit else None
+    page = page_model.model_validate({"items": rows, "next_after": next_after}, from_attributes=True)
+    return Response(content=page.model_dump_json(), media_type="application/json")
+
+# Helper function to apply keyset pagination: rows with id greater than the cursor, in id order
+def paginate(query, model, after: Optional[int], limit: int):
+    if after is not None:
+        query = query.where(model.id > after)
+    return query.order_by(model.id).limit(limit)
+
+# Create Database Tables, at most once per process
+async def init_db():
+    global _db_initialized
+    if _db_initialized:
+        return
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_missing_indexes)
+    _db_initialized = True
+
+# Build the engine and session factory up front
+@app.on_event("startup")
+async def build_db_engine():
+    get_sessionmaker()
+
+@app.on_event("startup")
+async def create_tables():
+    if DB_INIT_ON_STARTUP:
+        await init_db()
+
+# Preload known breeds and schedule their periodic refresh
+@app.on_event("startup")
+async def preload_breeds():
+    global _breeds_refresh_task
+    try:
+        await load_breeds()
+    except BREED_LOAD_ERRORS:
+        logger.warning("Failed to preload breeds from TheCatAPI", exc_info=True)
+    _breeds_refresh_task = asyncio.create_task(refresh_breeds_periodically())
+
+# Close the pooled database connections
+@app.on_event("shutdown")
+async def dispose_db_engine():
+    await get_engine().dispose()
+
+# Stop the breed refresher and close TheCatAPI client connections
+@app.on_event("shutdown")
+async def close_cat_client():
+    if _breeds_refresh_task:
+        _breeds_refresh_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _breeds_refresh_task
+    await cat_client.aclose()
 
 # API Endpoints for Spy Cats Management
 @app.post("/spy_cats/", response_model=SpyCatRead)
-def create_spy_cat(spy_cat: SpyCatCreate, db: Session = Depends(get_db)):
-    validate_cat_breed(spy_cat.breed)
+async def create_spy_cat(spy_cat: SpyCatCreate, db: AsyncSession = Depends(get_db)):
+    await validate_cat_breed(spy_cat.breed)
     db_spy_cat = SpyCat(**spy_cat.model_dump())
     db.add(db_spy_cat)
-    db.commit()
-    db.refresh(db_spy_cat)
+    await db.commit()
+    await db.refresh(db_spy_cat)
     return db_spy_cat
 
-@app.get("/spy_cats/", response_model=List[SpyCatRead])
-def list_spy_cats(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return db.query(SpyCat).offset(skip).limit(limit).all()
+@app.get("/spy_cats/", response_model=SpyCatPage)
+async def list_spy_cats(after: Optional[int] = None, limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    query = select(SpyCat).options(*strict_load_options())
+    result = await db.execute(paginate(query, SpyCat, after, limit))
+    return page_response(SpyCatPage, result.scalars().all(), limit)
 
 @app.get("/spy_cats/{spy_cat_id}", response_model=SpyCatRead)
-def read_spy_cat(spy_cat_id: int, db: Session = Depends(get_db)):
-    spy_cat = db.query(SpyCat).filter(SpyCat.id == spy_cat_id).first()
+async def read_spy_cat(spy_cat_id: int, db: AsyncSession = Depends(get_db)):
+    spy_cat = await db.get(SpyCat, spy_cat_id)
     if not spy_cat:
         raise HTTPException(status_code=404, detail="Spy Cat not found")
     return spy_cat
 
 @app.put("/spy_cats/{spy_cat_id}", response_model=SpyCatRead)
-def update_spy_cat(spy_cat_id: int, spy_cat: SpyCatCreate, db: Session = Depends(get_db)):
-    validate_cat_breed(spy_cat.breed)
-    db_spy_cat = db.query(SpyCat).filter(SpyCat.id == spy_cat_id).first()
+async def update_spy_cat(spy_cat_id: int, spy_cat: SpyCatCreate, db: AsyncSession = Depends(get_db)):
+    await validate_cat_breed(spy_cat.breed)
+    db_spy_cat = await db.get(SpyCat, spy_cat_id)
     if not db_spy_cat:
         raise HTTPException(status_code=404, detail="Spy Cat not found")
     for key, value in spy_cat.model_dump().items():
         setattr(db_spy_cat, key, value)
-    db.commit()
-    db.refresh(db_spy_cat)
+    await db.commit()
+    await db.refresh(db_spy_cat)
     return db_spy_cat
 
 @app.post("/spy_cats/{spy_cat_id}/assign_mission/", response_model=SpyCatRead)
-def assign_mission_to_cat(spy_cat_id: int, mission_id: int, db: Session = Depends(get_db)):
-    spy_cat = db.query(SpyCat).filter(SpyCat.id == spy_cat_id).first()
+async def assign_mission_to_cat(spy_cat_id: int, mission_id: int, db: AsyncSession = Depends(get_db)):
+    # Assign only a free cat to an open mission, atomically in a single UPDATE
+    mission_is_open = exists().where(Mission.id == mission_id, Mission.is_completed.isnot(True))
+    result = await db.execute(
+        update(SpyCat)
+        .where(SpyCat.id == spy_cat_id, SpyCat.current_mission_id.is_(None), mission_is_open)
+        .values(current_mission_id=mission_id)
+        .returning(SpyCat)
+    )
+    spy_cat = result.scalars().first()
+    if spy_cat:
+        await db.commit()
+        return spy_cat
+
+    # Nothing was updated, find out why
+    spy_cat = await db.get(SpyCat, spy_cat_id)
     if not spy_cat:
         raise HTTPException(status_code=404, detail="Spy Cat not found")
 
     if spy_cat.current_mission_id:
         raise HTTPException(status_code=400, detail="Spy Cat already has an active mission")
 
-    mission = get_mission_by_id(mission_id, db)
-
-    if mission.is_completed:
-        raise HTTPException(status_code=400, detail="Cannot assign a completed mission")
-
-    spy_cat.current_mission_id = mission_id
-    db.commit()
-    db.refresh(spy_cat)
-    return spy_cat
+    mission = await db.get(Mission, mission_id)
+    if not mission:
+        raise HTTPException(status_code=404, detail="Mission not found")
+    raise HTTPException(status_code=400, detail="Cannot assign a completed mission")
 
 @app.delete("/spy_cats/{spy_cat_id}", response_model=dict)
-def delete_spy_cat(spy_cat_id: int, db: Session = Depends(get_db)):
-    db_spy_cat = db.query(SpyCat).filter(SpyCat.id == spy_cat_id).first()
-    if not db_spy_cat:
+async def delete_spy_cat(spy_cat_id: int, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(delete(SpyCat).where(SpyCat.id == spy_cat_id))
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Spy Cat not found")
-    db.delete(db_spy_cat)
-    db.commit()
+    await db.commit()
     return {"detail": "Spy Cat deleted"}
 
 @app.post("/missions/", response_model=MissionRead)
-def create_mission(mission: MissionCreate, db: Session = Depends(get_db)):
+async def create_mission(mission: MissionCreate, db: AsyncSession = Depends(get_db)):
     db_mission = Mission(description=mission.description, is_completed=mission.is_completed)
     db.add(db_mission)
-    db.commit()
-    db.refresh(db_mission)
-    for target in mission.targets:
-        db_target = Target(**target.model_dump(), mission_id=db_mission.id)
-        db.add(db_target)
-    db.commit()
-    db.refresh(db_mission)
+    await db.flush()
+    db.add_all([Target(**target.model_dump(), mission_id=db_mission.id) for target in mission.targets])
+    await db.commit()
+    await db.refresh(db_mission, ["targets", "assigned_cats"])
     return db_mission
 
-@app.get("/missions/", response_model=List[MissionRead])
-def list_missions(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return db.query(Mission).offset(skip).limit(limit).all()
+@app.get("/missions/", response_model=MissionPage)
+async def list_missions(after: Optional[int] = None, limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
+    query = select(Mission).options(*mission_load_options(), *strict_load_options())
+    result = await db.execute(paginate(query, Mission, after, limit))
+    return page_response(MissionPage, result.scalars().all(), limit)
 
 @app.get("/missions/{mission_id}", response_model=MissionRead)
-def read_mission(mission_id: int, db: Session = Depends(get_db)):
-    mission = get_mission_by_id(mission_id, db)
-    mission.assigned_cats = db.query(SpyCat).filter(SpyCat.current_mission_id == mission_id).all()
-    return mission
+async def read_mission(mission_id: int, db: AsyncSession = Depends(get_db)):
+    return await get_mission_by_id(mission_id, db)
 
 @app.put("/missions/{mission_id}", response_model=MissionRead)
-def update_mission(mission_id: int, mission: MissionBase, db: Session = Depends(get_db)):
-    db_mission = get_mission_by_id(mission_id, db)
+async def update_mission(mission_id: int, mission: MissionBase, db: AsyncSession = Depends(get_db)):
+    db_mission = await get_mission_by_id(mission_id, db)
     if db_mission.is_completed:
         raise HTTPException(status_code=400, detail="Cannot update a completed mission")
     for key, value in mission.model_dump().items():
         setattr(db_mission, key, value)
-    db.commit()
-    db.refresh(db_mission)
+    await db.commit()
+    await db.refresh(db_mission)
     return db_mission
 
 @app.delete("/missions/{mission_id}", response_model=dict)
-def delete_mission(mission_id: int, db: Session = Depends(get_db)):
-    db_mission = get_mission_by_id(mission_id, db)
-    if db_mission.assigned_cats:
-        raise HTTPException(status_code=400, detail="Cannot delete a mission assigned to a cat")
-    db.delete(db_mission)
-    db.commit()
+async def delete_mission(mission_id: int, db: AsyncSession = Depends(get_db)):
+    # Delete the mission only if no cat is assigned to it, then its targets, in one transaction
+    has_assigned_cats = exists().where(SpyCat.current_mission_id == mission_id)
+    result = await db.execute(delete(Mission).where(Mission.id == mission_id, ~has_assigned_cats))
+    if result.rowcount == 0:
+        if await db.scalar(select(exists().where(Mission.id == mission_id))):
+            raise HTTPException(status_code=400, detail="Cannot delete a mission assigned to a cat")
+        raise HTTPException(status_code=404, detail="Mission not found")
+    await db.execute(delete(Target).where(Target.mission_id == mission_id))
+    await db.commit()
     return {"detail": "Mission deleted"}
+
+# Create the database schema ahead of deployment: python -m main
+async def init_db_and_exit():
+    await init_db()
+    await get_engine().dispose()
+
+if __name__ == "__main__":
+    asyncio.run(init_db_and_exit())
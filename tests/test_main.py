@@ -0,0 +1,96 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+from sqlalchemy import event
+from sqlalchemy.orm import selectinload
+
+import main
+
+
+# TheCatAPI replacement answering with a fixed breed list
+def cat_api(request):
+    return httpx.Response(200, json=[{"name": "Siamese"}, {"name": "Bengal"}])
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(main, "_db_initialized", False)
+    monkeypatch.setattr(main, "cat_client", httpx.AsyncClient(transport=httpx.MockTransport(cat_api)))
+    main.get_engine.cache_clear()
+    main.get_sessionmaker.cache_clear()
+    with TestClient(main.app) as client:
+        yield client
+        # Close the pooled connections on the app's loop before the engine is forgotten
+        client.portal.call(main.get_engine().dispose)
+    main.get_engine.cache_clear()
+    main.get_sessionmaker.cache_clear()
+
+
+# Records the SELECT statements sent to the database while the test runs
+@pytest.fixture
+def selects(client):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    engine = main.get_engine().sync_engine
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def seeded(client):
+    for i in range(3):
+        cat = client.post("/spy_cats/", json={"name": f"Cat {i}", "experience_years": i, "breed": "Siamese", "salary": 100})
+        mission = client.post(
+            "/missions/",
+            json={"description": f"Mission {i}", "targets": [{"name": "A", "country": "UA", "notes": None}, {"name": "B", "country": "PL", "notes": None}]},
+        )
+        client.post(f"/spy_cats/{cat.json()['id']}/assign_mission/", params={"mission_id": mission.json()["id"]})
+
+
+def test_list_spy_cats_issues_one_select(client, seeded, selects):
+    response = client.get("/spy_cats/")
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 3
+    assert len(selects) == 1
+
+
+def test_list_missions_batches_relationship_loads(client, seeded, selects):
+    response = client.get("/missions/")
+    assert response.status_code == 200
+    missions = response.json()["items"]
+    assert len(missions) == 3
+    assert all(len(m["targets"]) == 2 and len(m["assigned_cats"]) == 1 for m in missions)
+    # One SELECT for the missions plus one batched selectinload per relationship
+    assert len(selects) == 3
+
+
+@pytest.mark.parametrize("path", ["/spy_cats/", "/missions/"])
+def test_keyset_pagination_walks_every_row_once(client, seeded, path):
+    all_ids = [item["id"] for item in client.get(path, params={"limit": 100}).json()["items"]]
+    seen, after = [], None
+    while True:
+        params = {"limit": 1} if after is None else {"limit": 1, "after": after}
+        page = client.get(path, params=params).json()
+        seen += [item["id"] for item in page["items"]]
+        if page["next_after"] is None:
+            break
+        assert page["next_after"] == seen[-1]
+        after = page["next_after"]
+    assert seen == all_ids
+    assert len(seen) == 3
+    assert page["items"] == []
+
+
+@pytest.mark.parametrize("debug, error", [(True, "lazy='raise'"), (False, "MissingGreenlet")])
+def test_debug_turns_lazy_load_into_raiseload_error(client, seeded, monkeypatch, debug, error):
+    monkeypatch.setattr(main, "DEBUG", debug)
+    monkeypatch.setattr(main, "mission_load_options", lambda: (selectinload(main.Mission.targets),))
+    with pytest.raises(ValidationError, match=error):
+        client.get("/missions/")